@@ -111,7 +111,8 @@ void flash_maxsumexp_async(const Tensor<T> &Q, const Tensor<T> &K,
         auto q_tile_handle = Q.get_tile_handle(q_tile_index);
         mask_tile_index[1] = maxsumexp_tile_index[1];
         // Launch kernel for each appropriate tile of K to accumulate maxsumexp
-        // result
+        // result. With redux tiles of K are processed in parallel and merged
+        // by the maxsumexp reduction of the destination handle.
         for(Index j = 0; j < K.grid.shape[1]; ++j)
         {
             tmp_tile_index[0] = j;
@@ -124,7 +125,7 @@ void flash_maxsumexp_async(const Tensor<T> &Q, const Tensor<T> &K,
             starpu::flash_maxsumexp::submit<T>(n_seq_tile, head_size,
                     n_batch_tile*n_head_tile, k_tile_handle, q_tile_handle,
                     mask_tile_handle, maxsumexp_tile_handle, tmp_tile_handle,
-                    redux=0);
+                    redux);
         }
     }
 }
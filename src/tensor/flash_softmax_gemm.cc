@@ -119,7 +119,9 @@ void flash_softmax_gemm_async(const Tensor<T> &Q, const Tensor<T> &K,
         // Clear destination buffer at first
         starpu::clear::submit(dst_tile_handle);
         // Launch kernel for each appropriate tile of K and V to accumulate
-        // result into destination tensor
+        // result into destination tensor. With redux tiles of K and V are
+        // processed in parallel and summed by the reduction of the
+        // destination handle.
         for(Index j = 0; j < K.grid.shape[1]; ++j)
         {
             tmp_tile_index[0] = j;
@@ -135,7 +137,7 @@ void flash_softmax_gemm_async(const Tensor<T> &Q, const Tensor<T> &K,
                     n_seq_tile, head_size, n_batch_tile*n_head_tile,
                     k_tile_handle, q_tile_handle, mask_tile_handle,
                     maxsumexp_tile_handle, v_tile_handle, dst_tile_handle,
-                    tmp_tile_handle, redux=0);
+                    tmp_tile_handle, redux);
         }
     }
 }
@@ -157,7 +157,7 @@ void flash_softmax_gemm_backward_async(const Tensor<T> &Q, const Tensor<T> &dQ,
                     k_tile_handle, q_tile_handle, mask_tile_handle,
                     maxsumexp_tile_handle, dst_grad_tile_handle, v_tile_handle,
                     dV_tile_handle, tmp_sumprod_slice_tile_handle,
-                    tmp_tile_handle, tmp_grad_tile_handle, redux=0);
+                    tmp_tile_handle, tmp_grad_tile_handle, redux);
         }
     }
     // Cycle for all tiles of dK/dV tensor
@@ -210,7 +210,7 @@ void flash_softmax_gemm_backward_async(const Tensor<T> &Q, const Tensor<T> &dQ,
                     k_tile_handle, q_tile_handle, mask_tile_handle,
                     maxsumexp_tile_handle, dst_grad_tile_handle, v_tile_handle,
                     tmp_sumprod_slice_tile_handle, dQ_tile_handle, dK_tile_handle,
-                    tmp_tile_handle, tmp_grad_tile_handle, redux=0);
+                    tmp_tile_handle, tmp_grad_tile_handle, redux);
         }
     }
 }
@@ -11,6 +11,7 @@
 #
 # @version 1.1.0
 
+import math
 from typing import Optional
 
 import numpy as np
@@ -20,10 +21,11 @@ from nntile.layer.base_layer import BaseLayer
 from nntile.layer.cache_utils import KVCache
 from nntile.tensor import (
     Tensor, Tensor_bool, TensorMoments, TensorTraits, add_fiber_inplace_async,
-    add_slice_inplace_async, clear_async, copy_intersection_async, gemm_async,
-    mask_scalar_async, maxsumexp_async, notrans, prod_inplace_async,
-    softmax_inplace_async, sum_fiber_async, sumprod_slice_async, trans,
-    transpose_async)
+    add_slice_inplace_async, clear_async, copy_intersection_async,
+    flash_maxsumexp_async, flash_softmax_gemm_async,
+    flash_softmax_gemm_backward_async, gemm_async, mask_scalar_async,
+    maxsumexp_async, notrans, prod_inplace_async, softmax_inplace_async,
+    sum_fiber_async, sumprod_slice_async, trans, transpose_async)
 
 
 # Multi-head attention
@@ -55,6 +57,7 @@ class Attention(BaseLayer):
     b_transposed: TensorMoments
     n_head: int
     head_size: int
+    flash_attention: bool
 
     # Construct attention layer with all the provided data
     def __init__(
@@ -83,6 +86,7 @@ class Attention(BaseLayer):
         in_proj_bias_v: TensorMoments,
         out_proj_bias: TensorMoments,
         mask=None,
+        flash_attention: bool = False,
         redux: bool = False,
     ):
         qkv_bias_list = []
@@ -169,12 +173,35 @@ class Attention(BaseLayer):
 
         head_size = self.n_emb // self.n_head
         # Stupid check, that is not necessary, as the code shall work
-        if self.n_emb != head_size * self.n_head:
+        if self.n_emb % self.n_head != 0:
             raise RuntimeError
         self.head_size = head_size
+        # Scaling factor of attention scores, shared by forward and backward
+        self.inv_sqrt_head = 1.0 / math.sqrt(head_size)
         self.mask = mask
         if mask:
             self.val = -np.float32(np.inf)
+        # Fused kernels take the mask as an input, there is no unmasked variant
+        if flash_attention and mask is None:
+            raise ValueError("Flash attention requires a mask")
+        # Fused kernels size every task by the base tile, so all tiles of
+        # heads and sequence must be full
+        if flash_attention:
+            if self.n_head % self.n_head_tile != 0:
+                raise ValueError("Flash attention requires n_head to be "
+                        "divisible by n_head_tile")
+            n_seq = x_q.value.shape[1]
+            n_seq_tile = x_q.value.basetile_shape[1]
+            if n_seq % n_seq_tile != 0:
+                raise ValueError("Flash attention requires n_seq to be "
+                        "divisible by n_seq_tile")
+        self.flash_attention = flash_attention
+        # Non-fused path folds the score scaling into the Q projection, as Q
+        # is smaller than A. Fused kernels scale scores internally instead.
+        if flash_attention:
+            self.q_scale = 1.0
+        else:
+            self.q_scale = self.inv_sqrt_head
         if redux:
             self.redux = 1
         else:
@@ -186,8 +213,9 @@ class Attention(BaseLayer):
         clear_async(self.v.value)
 
     # Simple generator for the linear layer
-    @staticmethod
+    @classmethod
     def generate_simple(
+        cls,
         x_q: TensorMoments,
         x_k: TensorMoments,
         x_v: TensorMoments,
@@ -196,6 +224,7 @@ class Attention(BaseLayer):
         next_tag: int,
         bias=False,
         mask=None,
+        flash_attention: bool = False,
         redux: bool = False,
     ):
         # Get sizes
@@ -203,7 +232,7 @@ class Attention(BaseLayer):
         n_emb_tile, n_seq_tile, n_batch_tile = x_q.value.basetile_shape
         head_size = n_emb // n_head
         # Stupid check, that is not necessary, as the code shall work
-        if n_emb != head_size * n_head:
+        if n_emb % n_head != 0:
             raise RuntimeError
         n_emb_k = x_k.value.shape[0]
         n_emb_k_tile = x_k.value.basetile_shape[0]
@@ -226,15 +255,9 @@ class Attention(BaseLayer):
         w_shape = [n_emb, n_head, head_size]
         q_transposed_shape = [n_head, head_size, n_seq, n_batch]
         q_shape = [head_size, n_seq, n_batch, n_head]
-        k_transposed_shape = [n_head, head_size, n_seq, n_batch]
-        k_shape = [head_size, n_seq, n_batch, n_head]
-        v_transposed_shape = [n_head, head_size, n_seq, n_batch]
-        v_shape = [head_size, n_seq, n_batch, n_head]
         a_shape = [n_seq, n_seq, n_batch, n_head]
         a_maxsumexp_shape = [2, n_seq, n_batch, n_head]
         a_sumprod_slice_shape = [n_seq, n_batch, n_head]
-        b_shape = [head_size, n_seq, n_batch, n_head]
-        b_transposed_shape = [n_head, head_size, n_seq, n_batch]
         # Define tile shapes of each tensor
         w_q_basetile = [n_head_tile, head_size_tile, n_emb_tile]
         w_k_basetile = [n_head_tile, head_size_tile, n_emb_k_tile]
@@ -247,30 +270,9 @@ class Attention(BaseLayer):
             n_batch_tile,
         ]
         q_basetile = [head_size_tile, n_seq_tile, n_batch_tile, n_head_tile]
-        k_transposed_basetile = [
-            n_head_tile,
-            head_size_tile,
-            n_seq_tile,
-            n_batch_tile,
-        ]
-        k_basetile = [head_size_tile, n_seq_tile, n_batch_tile, n_head_tile]
-        v_transposed_basetile = [
-            n_head_tile,
-            head_size_tile,
-            n_seq_tile,
-            n_batch_tile,
-        ]
-        v_basetile = [head_size_tile, n_seq_tile, n_batch_tile, n_head_tile]
         a_basetile = [n_seq_tile, n_seq_tile, n_batch_tile, n_head_tile]
         a_maxsumexp_basetile = [2, n_seq_tile, n_batch_tile, n_head_tile]
         a_sumprod_slice_basetile = [n_seq_tile, n_batch_tile, n_head_tile]
-        b_basetile = [head_size_tile, n_seq_tile, n_batch_tile, n_head_tile]
-        b_transposed_basetile = [
-            n_head_tile,
-            head_size_tile,
-            n_seq_tile,
-            n_batch_tile,
-        ]
         # Define traits
         w_q_traits = TensorTraits(w_q_shape, w_q_basetile)
         w_k_traits = TensorTraits(w_k_shape, w_k_basetile)
@@ -280,14 +282,6 @@ class Attention(BaseLayer):
             q_transposed_shape, q_transposed_basetile
         )
         q_traits = TensorTraits(q_shape, q_basetile)
-        k_transposed_traits = TensorTraits(
-            k_transposed_shape, k_transposed_basetile
-        )
-        k_traits = TensorTraits(k_shape, k_basetile)
-        v_transposed_traits = TensorTraits(
-            v_transposed_shape, v_transposed_basetile
-        )
-        v_traits = TensorTraits(v_shape, v_basetile)
         a_traits = TensorTraits(a_shape, a_basetile)
         a_maxsumexp_traits = TensorTraits(
             a_maxsumexp_shape, a_maxsumexp_basetile
@@ -295,10 +289,13 @@ class Attention(BaseLayer):
         a_sumprod_slice_traits = TensorTraits(
             a_sumprod_slice_shape, a_sumprod_slice_basetile
         )
-        b_traits = TensorTraits(b_shape, b_basetile)
-        b_transposed_traits = TensorTraits(
-            b_transposed_shape, b_transposed_basetile
-        )
+        # K, V and B share the layout of Q, so reuse its traits
+        k_transposed_traits = q_transposed_traits
+        k_traits = q_traits
+        v_transposed_traits = q_transposed_traits
+        v_traits = q_traits
+        b_traits = q_traits
+        b_transposed_traits = q_transposed_traits
         # TODO change distribution
         w_q_distr = [0] * w_q_traits.grid.nelems
         w_k_distr = [0] * w_k_traits.grid.nelems
@@ -306,33 +303,35 @@ class Attention(BaseLayer):
         w_distr = [0] * w_traits.grid.nelems
         q_transposed_distr = [0] * q_transposed_traits.grid.nelems
         q_distr = [0] * q_traits.grid.nelems
-        k_transposed_distr = [0] * k_transposed_traits.grid.nelems
-        k_distr = [0] * k_traits.grid.nelems
-        v_transposed_distr = [0] * v_transposed_traits.grid.nelems
-        v_distr = [0] * v_traits.grid.nelems
         a_distr = [0] * a_traits.grid.nelems
         a_maxsumexp_distr = [0] * a_maxsumexp_traits.grid.nelems
         a_sumprod_slice_distr = [0] * a_sumprod_slice_traits.grid.nelems
-        b_distr = [0] * b_traits.grid.nelems
-        b_transposed_distr = [0] * b_transposed_traits.grid.nelems
+        k_transposed_distr = q_transposed_distr
+        k_distr = q_distr
+        v_transposed_distr = q_transposed_distr
+        v_distr = q_distr
+        b_distr = q_distr
+        b_transposed_distr = q_transposed_distr
         if bias:
             in_proj_bias_qkv_traits = TensorTraits(
                 [head_size, n_head], [head_size_tile, n_head_tile]
             )
             in_proj_bias_qkv_distr = [0] * in_proj_bias_qkv_traits.grid.nelems
+        # All the tensors share the type of the input
+        tensor_type = type(x_q.value)
         # Define all the lists
         # w_q
-        w_q_value = type(x_q.value)(w_q_traits, w_q_distr, next_tag)
+        w_q_value = tensor_type(w_q_traits, w_q_distr, next_tag)
         next_tag = w_q_value.next_tag
-        w_q_grad = type(x_q.value)(w_q_traits, w_q_distr, next_tag)
+        w_q_grad = tensor_type(w_q_traits, w_q_distr, next_tag)
         next_tag = w_q_grad.next_tag
         w_q = TensorMoments(w_q_value, w_q_grad, True)
         if bias:
-            in_proj_bias_q_value = type(x_q.value)(
+            in_proj_bias_q_value = tensor_type(
                 in_proj_bias_qkv_traits, in_proj_bias_qkv_distr, next_tag
             )
             next_tag = in_proj_bias_q_value.next_tag
-            in_proj_bias_q_grad = type(x_q.value)(
+            in_proj_bias_q_grad = tensor_type(
                 in_proj_bias_qkv_traits, in_proj_bias_qkv_distr, next_tag
             )
             next_tag = in_proj_bias_q_grad.next_tag
@@ -342,17 +341,17 @@ class Attention(BaseLayer):
         else:
             bias_inproj_q = None
         # w_k
-        w_k_value = type(x_q.value)(w_k_traits, w_k_distr, next_tag)
+        w_k_value = tensor_type(w_k_traits, w_k_distr, next_tag)
         next_tag = w_k_value.next_tag
-        w_k_grad = type(x_q.value)(w_k_traits, w_k_distr, next_tag)
+        w_k_grad = tensor_type(w_k_traits, w_k_distr, next_tag)
         next_tag = w_k_grad.next_tag
         w_k = TensorMoments(w_k_value, w_k_grad, True)
         if bias:
-            in_proj_bias_k_value = type(x_q.value)(
+            in_proj_bias_k_value = tensor_type(
                 in_proj_bias_qkv_traits, in_proj_bias_qkv_distr, next_tag
             )
             next_tag = in_proj_bias_k_value.next_tag
-            in_proj_bias_k_grad = type(x_q.value)(
+            in_proj_bias_k_grad = tensor_type(
                 in_proj_bias_qkv_traits, in_proj_bias_qkv_distr, next_tag
             )
             next_tag = in_proj_bias_k_grad.next_tag
@@ -362,17 +361,17 @@ class Attention(BaseLayer):
         else:
             bias_inproj_k = None
         # w_v
-        w_v_value = type(x_q.value)(w_v_traits, w_v_distr, next_tag)
+        w_v_value = tensor_type(w_v_traits, w_v_distr, next_tag)
         next_tag = w_v_value.next_tag
-        w_v_grad = type(x_q.value)(w_v_traits, w_v_distr, next_tag)
+        w_v_grad = tensor_type(w_v_traits, w_v_distr, next_tag)
         next_tag = w_v_grad.next_tag
         w_v = TensorMoments(w_v_value, w_v_grad, True)
         if bias:
-            in_proj_bias_v_value = type(x_q.value)(
+            in_proj_bias_v_value = tensor_type(
                 in_proj_bias_qkv_traits, in_proj_bias_qkv_distr, next_tag
             )
             next_tag = in_proj_bias_v_value.next_tag
-            in_proj_bias_v_grad = type(x_q.value)(
+            in_proj_bias_v_grad = tensor_type(
                 in_proj_bias_qkv_traits, in_proj_bias_qkv_distr, next_tag
             )
             next_tag = in_proj_bias_v_grad.next_tag
@@ -382,17 +381,17 @@ class Attention(BaseLayer):
         else:
             bias_inproj_v = None
         # w
-        w_value = type(x_q.value)(w_traits, w_distr, next_tag)
+        w_value = tensor_type(w_traits, w_distr, next_tag)
         next_tag = w_value.next_tag
-        w_grad = type(x_q.value)(w_traits, w_distr, next_tag)
+        w_grad = tensor_type(w_traits, w_distr, next_tag)
         next_tag = w_grad.next_tag
         w = TensorMoments(w_value, w_grad, True)
         # q_transposed
-        q_transposed_value = type(x_q.value)(
+        q_transposed_value = tensor_type(
             q_transposed_traits, q_transposed_distr, next_tag
         )
         next_tag = q_transposed_value.next_tag
-        q_transposed_grad = type(x_q.value)(
+        q_transposed_grad = tensor_type(
             q_transposed_traits, q_transposed_distr, next_tag
         )
         next_tag = q_transposed_grad.next_tag
@@ -400,17 +399,17 @@ class Attention(BaseLayer):
             q_transposed_value, q_transposed_grad, True
         )
         # q
-        q_value = type(x_q.value)(q_traits, q_distr, next_tag)
+        q_value = tensor_type(q_traits, q_distr, next_tag)
         next_tag = q_value.next_tag
-        q_grad = type(x_q.value)(q_traits, q_distr, next_tag)
+        q_grad = tensor_type(q_traits, q_distr, next_tag)
         next_tag = q_grad.next_tag
         q = TensorMoments(q_value, q_grad, True)
         # k_transposed
-        k_transposed_value = type(x_q.value)(
+        k_transposed_value = tensor_type(
             k_transposed_traits, k_transposed_distr, next_tag
         )
         next_tag = k_transposed_value.next_tag
-        k_transposed_grad = type(x_q.value)(
+        k_transposed_grad = tensor_type(
             k_transposed_traits, k_transposed_distr, next_tag
         )
         next_tag = k_transposed_grad.next_tag
@@ -418,17 +417,17 @@ class Attention(BaseLayer):
             k_transposed_value, k_transposed_grad, True
         )
         # k
-        k_value = type(x_q.value)(k_traits, k_distr, next_tag)
+        k_value = tensor_type(k_traits, k_distr, next_tag)
         next_tag = k_value.next_tag
-        k_grad = type(x_q.value)(k_traits, k_distr, next_tag)
+        k_grad = tensor_type(k_traits, k_distr, next_tag)
         next_tag = k_grad.next_tag
         k = TensorMoments(k_value, k_grad, True)
         # v_transposed
-        v_transposed_value = type(x_q.value)(
+        v_transposed_value = tensor_type(
             v_transposed_traits, v_transposed_distr, next_tag
         )
         next_tag = v_transposed_value.next_tag
-        v_transposed_grad = type(x_q.value)(
+        v_transposed_grad = tensor_type(
             v_transposed_traits, v_transposed_distr, next_tag
         )
         next_tag = v_transposed_grad.next_tag
@@ -436,39 +435,39 @@ class Attention(BaseLayer):
             v_transposed_value, v_transposed_grad, True
         )
         # v
-        v_value = type(x_q.value)(v_traits, v_distr, next_tag)
+        v_value = tensor_type(v_traits, v_distr, next_tag)
         next_tag = v_value.next_tag
-        v_grad = type(x_q.value)(v_traits, v_distr, next_tag)
+        v_grad = tensor_type(v_traits, v_distr, next_tag)
         next_tag = v_grad.next_tag
         v = TensorMoments(v_value, v_grad, True)
         # a
-        a_value = type(x_q.value)(a_traits, a_distr, next_tag)
+        a_value = tensor_type(a_traits, a_distr, next_tag)
         next_tag = a_value.next_tag
-        a_grad = type(x_q.value)(a_traits, a_distr, next_tag)
+        a_grad = tensor_type(a_traits, a_distr, next_tag)
         next_tag = a_grad.next_tag
         a = TensorMoments(a_value, a_grad, True)
         # a_maxsumexp
-        a_maxsumexp = type(x_q.value)(
+        a_maxsumexp = tensor_type(
             a_maxsumexp_traits, a_maxsumexp_distr, next_tag
         )
         next_tag = a_maxsumexp.next_tag
         # a_sumprod_slice
-        a_sumprod_slice = type(x_q.value)(
+        a_sumprod_slice = tensor_type(
             a_sumprod_slice_traits, a_sumprod_slice_distr, next_tag
         )
         next_tag = a_sumprod_slice.next_tag
         # b
-        b_value = type(x_q.value)(b_traits, b_distr, next_tag)
+        b_value = tensor_type(b_traits, b_distr, next_tag)
         next_tag = b_value.next_tag
-        b_grad = type(x_q.value)(b_traits, b_distr, next_tag)
+        b_grad = tensor_type(b_traits, b_distr, next_tag)
         next_tag = b_grad.next_tag
         b = TensorMoments(b_value, b_grad, True)
         # b_transposed
-        b_transposed_value = type(x_q.value)(
+        b_transposed_value = tensor_type(
             b_transposed_traits, b_transposed_distr, next_tag
         )
         next_tag = b_transposed_value.next_tag
-        b_transposed_grad = type(x_q.value)(
+        b_transposed_grad = tensor_type(
             b_transposed_traits, b_transposed_distr, next_tag
         )
         next_tag = b_transposed_grad.next_tag
@@ -479,11 +478,11 @@ class Attention(BaseLayer):
         if bias:
             out_proj_bias_traits = TensorTraits([n_emb], [n_emb_tile])
             out_proj_bias_distr = [0] * out_proj_bias_traits.grid.nelems
-            out_proj_bias_value = type(x_q.value)(
+            out_proj_bias_value = tensor_type(
                 out_proj_bias_traits, out_proj_bias_distr, next_tag
             )
             next_tag = out_proj_bias_value.next_tag
-            out_proj_bias_grad = type(x_q.value)(
+            out_proj_bias_grad = tensor_type(
                 out_proj_bias_traits, out_proj_bias_distr, next_tag
             )
             next_tag = out_proj_bias_grad.next_tag
@@ -494,13 +493,13 @@ class Attention(BaseLayer):
             out_proj_bias = None
         # Allocate tensor for output y
         y_traits = TensorTraits(x_q.value.shape, x_q.value.basetile_shape)
-        y_value = type(x_q.value)(y_traits, x_q.value.distribution, next_tag)
+        y_value = tensor_type(y_traits, x_q.value.distribution, next_tag)
         next_tag = y_value.next_tag
-        y_grad = type(x_q.value)(y_traits, x_q.value.distribution, next_tag)
+        y_grad = tensor_type(y_traits, x_q.value.distribution, next_tag)
         next_tag = y_grad.next_tag
         y = TensorMoments(y_value, y_grad, True)
         # Create attention layer with all the provided data
-        layer = Attention(
+        layer = cls(
             x_q,
             x_k,
             x_v,
@@ -525,17 +524,18 @@ class Attention(BaseLayer):
             bias_inproj_v,
             out_proj_bias,
             mask,
+            flash_attention=flash_attention,
             redux=redux,
         )
         # Return layer and next tag to be used
         return (layer, next_tag)
 
     def _forward_mlp_q_async(self):
-        # Q_transposed = einsum('jkl,lmn->jkmn', W_Q, X_Q)
+        # Q_transposed = q_scale * einsum('jkl,lmn->jkmn', W_Q, X_Q)
         # gemm (n_head, head_size, n_emb) by (n_emb, n_seq, n_batch) into
         # (n_head, head_size, n_seq, n_batch)
         gemm_async(
-            1.0,
+            self.q_scale,
             notrans,
             self.w_q.value,
             notrans,
@@ -548,8 +548,7 @@ class Attention(BaseLayer):
         )
         # Rotate axes into (head_size, n_seq, n_batch, n_head)
         transpose_async(1.0, self.q_transposed.value, self.q.value, 1)
-        # X_Q, W_Q and Q_transposed can be offloaded from GPU
-        self.x_q.value.wont_use()
+        # W_Q and Q_transposed can be offloaded from GPU
         # self.q_transposed.value.wont_use()
         self.q_transposed.value.invalidate_submit()
         self.w_q.value.wont_use()
@@ -558,7 +557,7 @@ class Attention(BaseLayer):
             # batched add_fiber_inplace (head_size, batch=n_head) into
             # (head_size, n_seq, n_batch, batch=n_head)
             add_fiber_inplace_async(
-                1, self.in_proj_bias_q.value, 1, self.q.value, 0, 1
+                self.q_scale, self.in_proj_bias_q.value, 1, self.q.value, 0, 1
             )
             self.in_proj_bias_q.value.wont_use()
 
@@ -586,8 +585,9 @@ class Attention(BaseLayer):
         q_partial_tr = self._get_tmp_tr_for_cache(x)
         q_partial = self._get_tmp_for_cache(x)
 
+        # Dynamic attention is never fused, so Q always carries the scale
         gemm_async(
-            1.0,
+            self.inv_sqrt_head,
             notrans,
             self.w_q.value,
             notrans,
@@ -603,7 +603,12 @@ class Attention(BaseLayer):
 
         if self.in_proj_bias_q is not None:
             add_fiber_inplace_async(
-                1, self.in_proj_bias_q.value, 1, q_partial, 0, 1
+                self.inv_sqrt_head,
+                self.in_proj_bias_q.value,
+                1,
+                q_partial,
+                0,
+                1,
             )
 
         return q_partial
@@ -626,8 +631,7 @@ class Attention(BaseLayer):
         )
         # Rotate axes into (head_size, n_seq, n_batch, n_head)
         transpose_async(1.0, self.k_transposed.value, self.k.value, 1)
-        # X_K, W_K and K_transposed can be offloaded from GPU
-        self.x_k.value.wont_use()
+        # W_K and K_transposed can be offloaded from GPU
         # self.k_transposed.value.wont_use()
         self.k_transposed.value.invalidate_submit()
         self.w_k.value.wont_use()
@@ -684,8 +688,7 @@ class Attention(BaseLayer):
         )
         # Rotate axes into (head_size, n_seq, n_batch, n_head)
         transpose_async(1.0, self.v_transposed.value, self.v.value, 1)
-        # X_V, W_V and V_transposed can be offloaded from GPU
-        self.x_v.value.wont_use()
+        # W_V and V_transposed can be offloaded from GPU
         # self.v_transposed.value.wont_use()
         self.v_transposed.value.invalidate_submit()
         self.w_v.value.wont_use()
@@ -724,14 +727,46 @@ class Attention(BaseLayer):
 
         return v_partial
 
-    def _forward_attn_async(self):
+    def _flash_attention_fwd(self):
+        # Use flash-like maxsumexp
+        clear_async(self.a_maxsumexp)
+        flash_maxsumexp_async(
+            self.q.value,
+            self.k.value,
+            self.mask,
+            self.a_maxsumexp,
+            self.a.value,
+            redux=self.redux,
+        )
+        # Use flash-like softmax+gemm
+        flash_softmax_gemm_async(
+            self.q.value,
+            self.k.value,
+            self.v.value,
+            self.mask,
+            self.a_maxsumexp,
+            self.b.value,
+            self.a.value,
+            redux=self.redux,
+        )
+        # Q, K, V, mask and A_maxsumexp can be offloaded from GPU
+        self.q.value.wont_use()
+        self.k.value.wont_use()
+        self.v.value.wont_use()
+        self.mask.wont_use()
+        self.a_maxsumexp.wont_use()
+        # A can be deleted
+        self.a.value.invalidate_submit()
+
+    def _attention_fwd(self):
         # Get tensor for softmax
-        # A = 1.0/sqrt(head_size) * einsum('jklb,jmlb->kmlb', K, Q)
+        # A = einsum('jklb,jmlb->kmlb', K, Q), Q is already scaled by
+        # 1.0/sqrt(head_size)
         # single batched gemm (head_size, n_seq, batch=n_batch, batch=n_head)
         # by (head_size, n_seq, batch=n_batch, batch=n_head) into
         # (n_seq, n_seq, batch=n_batch, batch=n_head)
         gemm_async(
-            1.0 / self.head_size**0.5,
+            1.0,
             trans,
             self.k.value,
             notrans,
@@ -779,6 +814,13 @@ class Attention(BaseLayer):
         # V and A can be offloaded from GPU
         self.v.value.wont_use()
         self.a.value.wont_use()
+
+    def _forward_attn_async(self):
+        # Apply attention to Q, K and V into B
+        if self.flash_attention:
+            self._flash_attention_fwd()
+        else:
+            self._attention_fwd()
         # Accumulate result from all the heads
         # rotate axes (head_size, n_seq, n_batch, n_head) into
         # (n_head, head_size, n_seq, n_batch) and then
@@ -845,12 +887,13 @@ class Attention(BaseLayer):
         )  # (n_emb, n_seq, n_batch)
         y_tensor = self.y_tensor
         # Get tensor for softmax
-        # A = 1.0/sqrt(head_size) * einsum('jklb,jmlb->kmlb', K, Q)
+        # A = einsum('jklb,jmlb->kmlb', K, Q), Q is already scaled by
+        # 1.0/sqrt(head_size)
         # single batched gemm (head_size, n_seq, batch=n_batch, batch=n_head)
         # by (head_size, n_seq, batch=n_batch, batch=n_head) into
         # (n_seq, n_seq, batch=n_batch, batch=n_head)
         gemm_async(
-            1.0 / self.head_size**0.5,
+            1.0,
             trans,
             k,
             notrans,
@@ -876,6 +919,8 @@ class Attention(BaseLayer):
                 self.mask, [0, 0], mask_tmp, [0, k.shape[1] - q.shape[1]]
             )
             mask_scalar_async(mask_tmp, self.val, a_tmp, 2)
+            # Mask is shared by all heads, offload it once it is applied
+            self.mask.wont_use()
 
         # Calculate max and sumexp along axis
         maxsumexp_async(a_tmp, a_maxsumexp_tmp, 0, redux=self.redux)
@@ -935,6 +980,12 @@ class Attention(BaseLayer):
         self._forward_mlp_q_async()
         self._forward_mlp_k_async()
         self._forward_mlp_v_async()
+        # X_Q, X_K and X_V can be offloaded from GPU only after all the
+        # projections are submitted, as they are the same tensor for
+        # self-attention
+        self.x_q.value.wont_use()
+        self.x_k.value.wont_use()
+        self.x_v.value.wont_use()
 
         # compute attention and weight result
         self._forward_attn_async()
@@ -966,65 +1017,44 @@ class Attention(BaseLayer):
         y_tensor = self._forward_attn_dynamic(q_partial, k, v)
         return TensorMoments(y_tensor, None, False), kv_cache
 
-    # Backward propagation of the linear layer
-    def backward_async(self):
-        # Apply backward of bias if needed
-        if self.out_proj_bias is not None:
-            if self.out_proj_bias.grad_required:
-                sum_fiber_async(
-                    1.0,
-                    self.y.grad,
-                    1.0,
-                    self.out_proj_bias.grad,
-                    0,
-                    0,
-                    redux=self.redux,
-                )
-                self.out_proj_bias.grad.wont_use()
-        # Backward for Y = einsum('jkl,klmn->jmn', W, B_transposed)
-        if self.w.grad_required:
-            # dW += einsum('jmn,klmn->jkl', dY, B_transposed)
-            gemm_async(
-                1.0,
-                notrans,
-                self.y.grad,
-                trans,
-                self.b_transposed.value,
-                1.0,
-                self.w.grad,
-                2,
-                0,
-                redux=self.redux,
-            )
-        # B_transposed can be deleted
-        # self.b_transposed.value.wont_use()
-        self.b_transposed.value.invalidate_submit()
-        self.w.grad.wont_use()
-        if self.b_transposed.grad_required:
-            # dB_transposed = einsum('jkl,jmn->klmn', W, dY)
-            gemm_async(
-                1.0,
-                trans,
-                self.w.value,
-                notrans,
-                self.y.grad,
-                0.0,
-                self.b_transposed.grad,
-                1,
-                0,
-                redux=self.redux,
-            )
-        # W can be offloaded from GPU
-        self.w.value.wont_use()
-        # dY can be offloaded from GPU
-        self.y.grad.wont_use()
-        # Backward for axes rotation
-        if self.b.grad_required:
-            # rotate axes (n_head, head_size, n_seq, n_batch) into
-            # (head_size, n_seq, n_batch, n_head) and then
-            transpose_async(1.0, self.b_transposed.grad, self.b.grad, 1)
-        # self.b_transposed.grad.wont_use()
-        self.b_transposed.grad.invalidate_submit()
+    def _flash_attention_bwd(self):
+        # Flash-like backward of softmax+gemm, that recomputes A tile by tile
+        clear_async(self.a_sumprod_slice)
+        flash_softmax_gemm_backward_async(
+            self.q.value,
+            self.q.grad,
+            self.k.value,
+            self.k.grad,
+            self.v.value,
+            self.v.grad,
+            self.mask,
+            self.a_maxsumexp,
+            self.b.grad,
+            self.a.value,
+            self.a.grad,
+            self.a_sumprod_slice,
+            redux=self.redux,
+        )
+        # Q can be deleted
+        self.q.value.invalidate_submit()
+        # K can be deleted
+        self.k.value.invalidate_submit()
+        # V can be deleted
+        self.v.value.invalidate_submit()
+        # mask can be offloaded from GPU
+        self.mask.wont_use()
+        # A_maxsumexp can be deleted
+        self.a_maxsumexp.invalidate_submit()
+        # dB can be deleted
+        self.b.grad.invalidate_submit()
+        # A can be deleted
+        self.a.value.invalidate_submit()
+        # dA can be deleted
+        self.a.grad.invalidate_submit()
+        # A_sumprod_slice can be deleted
+        self.a_sumprod_slice.invalidate_submit()
+
+    def _attention_bwd(self):
         # Backward for B = einsum('jklb,kmlb->jmlb', V, A)
         if self.a.grad_required:
             # dA = einsum('jklb,jmlb->kmlb', V, dB)
@@ -1088,12 +1118,12 @@ class Attention(BaseLayer):
         if self.mask:
             mask_scalar_async(self.mask, 0, self.a.grad, 2)
             self.mask.wont_use()
-        # Backward for:
-        # A = 1.0/sqrt(head_size) * einsum('jklb,jmlb->kmlb', K, Q)
+        # Backward for A = einsum('jklb,jmlb->kmlb', K, Q), where Q is
+        # already scaled by 1.0/sqrt(head_size)
         if self.k.grad_required:
-            # dK = 1.0/sqrt(head_size) * einsum('jmlb,kmlb->jklb', Q, dA)
+            # dK = einsum('jmlb,kmlb->jklb', Q, dA)
             gemm_async(
-                1.0 / self.head_size**0.5,
+                1.0,
                 notrans,
                 self.q.value,
                 trans,
@@ -1108,9 +1138,11 @@ class Attention(BaseLayer):
         # self.q.value.wont_use()
         self.q.value.invalidate_submit()
         if self.q.grad_required:
+            # Gradient over unscaled Q, so that the rest of the backward
+            # for the Q projection stays the same
             # dQ = 1.0/sqrt(head_size) * einsum('jklb,kmlb->jmlb', K, dA)
             gemm_async(
-                1.0 / self.head_size**0.5,
+                self.inv_sqrt_head,
                 notrans,
                 self.k.value,
                 notrans,
@@ -1127,6 +1159,71 @@ class Attention(BaseLayer):
         # dA can be deleted
         # self.a.grad.wont_use()
         self.a.grad.invalidate_submit()
+
+    # Backward propagation of the linear layer
+    def backward_async(self):
+        # Apply backward of bias if needed
+        if self.out_proj_bias is not None:
+            if self.out_proj_bias.grad_required:
+                sum_fiber_async(
+                    1.0,
+                    self.y.grad,
+                    1.0,
+                    self.out_proj_bias.grad,
+                    0,
+                    0,
+                    redux=self.redux,
+                )
+                self.out_proj_bias.grad.wont_use()
+        # Backward for Y = einsum('jkl,klmn->jmn', W, B_transposed)
+        if self.w.grad_required:
+            # dW += einsum('jmn,klmn->jkl', dY, B_transposed)
+            gemm_async(
+                1.0,
+                notrans,
+                self.y.grad,
+                trans,
+                self.b_transposed.value,
+                1.0,
+                self.w.grad,
+                2,
+                0,
+                redux=self.redux,
+            )
+        # B_transposed can be deleted
+        # self.b_transposed.value.wont_use()
+        self.b_transposed.value.invalidate_submit()
+        self.w.grad.wont_use()
+        if self.b_transposed.grad_required:
+            # dB_transposed = einsum('jkl,jmn->klmn', W, dY)
+            gemm_async(
+                1.0,
+                trans,
+                self.w.value,
+                notrans,
+                self.y.grad,
+                0.0,
+                self.b_transposed.grad,
+                1,
+                0,
+                redux=self.redux,
+            )
+        # W can be offloaded from GPU
+        self.w.value.wont_use()
+        # dY can be offloaded from GPU
+        self.y.grad.wont_use()
+        # Backward for axes rotation
+        if self.b.grad_required:
+            # rotate axes (n_head, head_size, n_seq, n_batch) into
+            # (head_size, n_seq, n_batch, n_head) and then
+            transpose_async(1.0, self.b_transposed.grad, self.b.grad, 1)
+        # self.b_transposed.grad.wont_use()
+        self.b_transposed.grad.invalidate_submit()
+        # Apply backward to (attention to Q, K and V into B)
+        if self.flash_attention:
+            self._flash_attention_bwd()
+        else:
+            self._attention_bwd()
         # Backward for bias of V
         if self.in_proj_bias_v is not None:
             if self.in_proj_bias_v.grad_required:
@@ -1165,8 +1262,6 @@ class Attention(BaseLayer):
             )
         # W_V can be offloaded from GPU
         self.w_v.value.wont_use()
-        # dX_V can be offloaded from GPU
-        self.x_v.grad.wont_use()
         if self.w_v.grad_required:
             # dW_V += einsum('jkmn,lmn->jkl', dV_transposed, X_V)
             gemm_async(
@@ -1183,8 +1278,6 @@ class Attention(BaseLayer):
             )
         # dW_V can be offloaded from GPU
         self.w_v.grad.wont_use()
-        # X_V can be offloaded from GPU
-        self.x_v.value.wont_use()
         # dV_transposed can be deleted
         # self.v_transposed.grad.wont_use()
         self.v_transposed.grad.invalidate_submit()
@@ -1226,8 +1319,6 @@ class Attention(BaseLayer):
             )
         # W_K can be offloaded from GPU
         self.w_k.value.wont_use()
-        # dX_K can be offloaded from GPU
-        self.x_k.grad.wont_use()
         if self.w_k.grad_required:
             # dW_K += einsum('jkmn,lmn->jkl', dK_transposed, X_K)
             gemm_async(
@@ -1244,8 +1335,6 @@ class Attention(BaseLayer):
             )
         # dW_K can be offloaded from GPU
         self.w_k.grad.wont_use()
-        # X_K can be offloaded from GPU
-        self.x_k.value.wont_use()
         # dK_transposed can be deleted
         # self.k_transposed.grad.wont_use()
         self.k_transposed.grad.invalidate_submit()
@@ -1285,11 +1374,8 @@ class Attention(BaseLayer):
                 0,
                 redux=self.redux,
             )
-            self.x_q.grad.wont_use()
         # W_Q can be offloaded from GPU
         self.w_q.value.wont_use()
-        # dX_Q can be offloaded from GPU
-        self.x_q.grad.wont_use()
         if self.w_q.grad_required:
             # dW_Q += einsum('jkmn,lmn->jkl', dQ_transposed, X_Q)
             gemm_async(
@@ -1306,8 +1392,15 @@ class Attention(BaseLayer):
             )
         # dW_Q can be offloaded from GPU
         self.w_q.grad.wont_use()
-        # X_Q can be offloaded from GPU
-        self.x_q.value.wont_use()
         # dQ_transposed can be deleted
         # self.q_transposed.grad.wont_use()
         self.q_transposed.grad.invalidate_submit()
+        # X_Q, X_K, X_V and their gradients can be offloaded from GPU only
+        # after all the projections are done, as they are the same tensors
+        # for self-attention
+        self.x_q.value.wont_use()
+        self.x_q.grad.wont_use()
+        self.x_k.value.wont_use()
+        self.x_k.grad.wont_use()
+        self.x_v.value.wont_use()
+        self.x_v.grad.wont_use()
@@ -169,6 +169,7 @@ class LlamaAttention(BaseLayer):
         self.q_transposed.value.set_reduction_add()
         self.q = q
         self.q_rope = q_rope
+        self.q_rope.grad.set_reduction_add()
         self.q.grad.set_reduction_add()
         self.k_transposed = k_transposed
         self.k_transposed.value.set_reduction_add()
@@ -19,8 +19,8 @@ import torch
 import nntile
 import nntile.utils.constructors as nntc
 from nntile.layer import (
-    Act, AddSlice, Attention, AttentionSingleHead, Embedding, FlashAttention,
-    LayerNorm, Linear)
+    Act, AddSlice, Attention, AttentionSingleHead, Embedding, LayerNorm,
+    Linear)
 from nntile.layer.add import Add
 from nntile.layer.cache_utils import KVCacheStorage
 from nntile.model.base_model import BaseModel
@@ -179,8 +179,6 @@ class GPT2Model(BaseModel, LLMGenerationMixin):
         if self.n_head == 1:
             print("Set 1 head")
             AttLayer = AttentionSingleHead
-        elif flashattention:
-            AttLayer = FlashAttention
         else:
             AttLayer = Attention
         seq_len = input_ids.value.shape[0]
@@ -265,6 +263,7 @@ class GPT2Model(BaseModel, LLMGenerationMixin):
                     next_tag,
                     True,
                     self.mask,
+                    flash_attention=flashattention,
                     redux=redux,
                 )
             layers.append(attn_layer)
@@ -21,7 +21,7 @@ from torch.nn import MultiheadAttention
 # All necesary imports
 import nntile
 import nntile.utils.constructors as nntc
-from nntile.layer import Attention
+from nntile.layer import Attention, FlashAttention
 
 # Define mapping between numpy and nntile types
 Tensor = {
@@ -29,6 +29,8 @@ Tensor = {
     np.float64: nntile.tensor.Tensor_fp64,
 }
 
+nocuda = pytest.mark.skipif(not torch.cuda.is_available(), reason='no cuda')
+
 
 @pytest.mark.parametrize("dtype", [np.float32, np.float64])
 def test_attention(starpu_simple, dtype: np.dtype):
@@ -258,6 +260,167 @@ def test_attention(starpu_simple, dtype: np.dtype):
     layer.unregister()
 
 
+# NNTile dtype via corresponding Tensor type. Fast types keep fp32 storage
+# and softmax statistics, while GEMMs are computed in reduced precision on
+# CUDA
+dtype2nntile = {
+        'fp32': nntile.tensor.Tensor_fp32,
+        'fp64': nntile.tensor.Tensor_fp64,
+        'fp32_fast_tf32': nntile.tensor.Tensor_fp32_fast_tf32,
+        'fp32_fast_fp16': nntile.tensor.Tensor_fp32_fast_fp16,
+        'fp32_fast_bf16': nntile.tensor.Tensor_fp32_fast_bf16,
+}
+
+dtype2tol = {
+        'fp32': {'rtol': 1e-5},
+        'fp64': {'rtol': 1e-5},
+        'fp32_fast_tf32': {'rtol': 2e-3},
+        'fp32_fast_fp16': {'rtol': 8e-3},
+        'fp32_fast_bf16': {'rtol': 8e-3},
+}
+
+
+@pytest.mark.parametrize('dtype', [
+    'fp32',
+    'fp64',
+    pytest.param('fp32_fast_tf32', marks=nocuda),
+    pytest.param('fp32_fast_fp16', marks=nocuda),
+    pytest.param('fp32_fast_bf16', marks=nocuda),
+])
+@pytest.mark.parametrize('redux', [False, True])
+def test_flash_attention(starpu_simple, numpy_rng, dtype: str, redux: bool):
+    n_emb = 16
+    n_seq = 8
+    n_seq_tile = 4
+    n_batch = 3
+    n_head = 4
+    n_head_tile = 2
+    X_shape = [n_emb, n_seq, n_batch]
+    X_basetile = [n_emb, n_seq_tile, n_batch]
+    tensor_type = dtype2nntile[dtype]
+    np_dtype = nntc.nnt2np_type_mapping[tensor_type]
+    np_X = np.array(numpy_rng.standard_normal(X_shape), dtype=np_dtype,
+            order="F")
+    np_Y_grad = np.array(numpy_rng.standard_normal(X_shape),
+            dtype=np_dtype, order="F")
+    np_mask = np.array(np.triu(np.ones((n_seq, n_seq))), dtype=bool,
+            order="F")
+    mask = nntc.from_array(np_mask, basetile_shape=[n_seq_tile, n_seq_tile])
+    # Both layers get the same weights. They are set from numpy, as there is
+    # no randn for every fast type.
+    np_params = None
+    inputs = []
+    layers = []
+    for flash_attention in [False, True]:
+        X = nntile.tensor.TensorMoments(
+            nntc.empty(X_shape, X_basetile, dtype=tensor_type),
+            nntc.zeros(X_shape, X_basetile, dtype=tensor_type),
+            True,
+        )
+        X.value.from_array(np_X)
+        # Reference is the non-fused layer without reductions, while the
+        # fused one reduces over tiles of K and V when redux is set
+        layer, _ = Attention.generate_simple(
+            X, X, X, n_head, n_head_tile, 0, bias=True, mask=mask,
+            flash_attention=flash_attention,
+            redux=redux and flash_attention,
+        )
+        if np_params is None:
+            np_params = [
+                np.array(
+                    numpy_rng.standard_normal(p.value.shape) / n_emb**0.5,
+                    dtype=np_dtype,
+                    order="F",
+                )
+                for p in layer.parameters
+            ]
+        for p, np_p in zip(layer.parameters, np_params):
+            p.value.from_array(np_p)
+        layer.clear_parameters_grads()
+        layer.forward_async()
+        layer.y.grad.from_array(np_Y_grad)
+        layer.backward_async()
+        inputs.append(X)
+        layers.append(layer)
+    # Compare forward and backward results
+    pairs = [
+        (layers[0].y.value, layers[1].y.value),
+        (inputs[0].grad, inputs[1].grad),
+        (layers[0].w_q.grad, layers[1].w_q.grad),
+        (layers[0].w_k.grad, layers[1].w_k.grad),
+        (layers[0].w_v.grad, layers[1].w_v.grad),
+        (layers[0].w.grad, layers[1].w.grad),
+        (layers[0].in_proj_bias_q.grad, layers[1].in_proj_bias_q.grad),
+        (layers[0].in_proj_bias_k.grad, layers[1].in_proj_bias_k.grad),
+        (layers[0].in_proj_bias_v.grad, layers[1].in_proj_bias_v.grad),
+        (layers[0].out_proj_bias.grad, layers[1].out_proj_bias.grad),
+    ]
+    for ref, flash in pairs:
+        np_ref = nntc.to_numpy(ref)
+        np_flash = nntc.to_numpy(flash)
+        norm = np.linalg.norm(np_ref)
+        diff = np.linalg.norm(np_ref - np_flash)
+        assert diff <= norm * dtype2tol[dtype]['rtol']
+    # Unregister
+    mask.unregister()
+    for X, layer in zip(inputs, layers):
+        X.unregister()
+        layer.unregister()
+
+
+@pytest.mark.parametrize('n_head_tile,n_seq_tile', [(3, 4), (2, 3)])
+def test_flash_attention_partial_tiles(starpu_simple, n_head_tile: int,
+                                       n_seq_tile: int):
+    n_emb = 16
+    n_seq = 8
+    n_batch = 3
+    n_head = 4
+    X_shape = [n_emb, n_seq, n_batch]
+    X_basetile = [n_emb, n_seq_tile, n_batch]
+    X = nntile.tensor.TensorMoments(
+        nntc.zeros(X_shape, X_basetile, dtype=nntile.tensor.Tensor_fp32),
+        nntc.zeros(X_shape, X_basetile, dtype=nntile.tensor.Tensor_fp32),
+        True,
+    )
+    np_mask = np.array(np.triu(np.ones((n_seq, n_seq))), dtype=bool,
+            order="F")
+    mask = nntc.from_array(np_mask, basetile_shape=[n_seq_tile, n_seq_tile])
+    # Fused kernels would run past the buffers of the last partial tile
+    with pytest.raises(ValueError):
+        Attention.generate_simple(
+            X, X, X, n_head, n_head_tile, 0, mask=mask, flash_attention=True
+        )
+    mask.unregister()
+    X.unregister()
+
+
+def test_flash_attention_alias(starpu_simple):
+    n_emb = 16
+    n_seq = 8
+    n_seq_tile = 4
+    n_batch = 3
+    n_head = 4
+    n_head_tile = 2
+    X_shape = [n_emb, n_seq, n_batch]
+    X_basetile = [n_emb, n_seq_tile, n_batch]
+    X = nntile.tensor.TensorMoments(
+        nntc.zeros(X_shape, X_basetile, dtype=nntile.tensor.Tensor_fp32),
+        nntc.zeros(X_shape, X_basetile, dtype=nntile.tensor.Tensor_fp32),
+        True,
+    )
+    np_mask = np.array(np.triu(np.ones((n_seq, n_seq))), dtype=bool,
+            order="F")
+    mask = nntc.from_array(np_mask, basetile_shape=[n_seq_tile, n_seq_tile])
+    layer, _ = FlashAttention.generate_simple(
+        X, X, X, n_head, n_head_tile, 0, mask=mask
+    )
+    assert isinstance(layer, FlashAttention)
+    assert layer.flash_attention
+    layer.unregister()
+    mask.unregister()
+    X.unregister()
+
+
 @pytest.mark.parametrize(
     "n_head,n_head_tile,n_emb,n_emb_tile,seq_size", [(2, 1, 6, 2, 10)]
 )
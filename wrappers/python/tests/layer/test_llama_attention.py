@@ -100,7 +100,7 @@ multiple_tiles = LlamaAttentionTestParams(
 
 
 def generate_inputs(dtype: str, params: LlamaAttentionTestParams, bias: bool,
-                    flash_attention: bool):
+                    flash_attention: bool, redux: bool = False):
     rng = np.random.default_rng(42)
     torch_layer_config = LlamaConfig_torch(
         hidden_size=params.n_emb,
@@ -126,7 +126,8 @@ def generate_inputs(dtype: str, params: LlamaAttentionTestParams, bias: bool,
         intermediate_size_tile=torch_layer_config.intermediate_size,
         vocab_size=torch_layer_config.vocab_size,
         vocab_embed_dim_tile=params.n_emb,
-        flash_attention=flash_attention)
+        flash_attention=flash_attention,
+        redux=redux)
 
     torch_layer = LlamaAttention_torch(
         torch_layer_config, layer_idx=params.layer_idx
@@ -265,6 +266,37 @@ class TestLlamaAttention:
         nntile_layer.y.unregister()
 
 
+@pytest.mark.parametrize('params', [
+    pytest.param(multiple_tiles, id='multiple_tiles'),
+])
+@pytest.mark.parametrize('dtype', ['fp32'])
+def test_flash_attention_redux(starpu_simple, torch_rng, dtype: str,
+                               params: LlamaAttentionTestParams):
+    # Same weights and inputs for both layers, only reductions over tiles
+    # of K and V differ, so redux=False serves as the reference
+    results = []
+    for redux in [False, True]:
+        torch.manual_seed(0)
+        _, nntile_layer, *_ = generate_inputs(dtype, params, False, True,
+                redux)
+        nntile_layer.forward_async()
+        for tensor in nntile_layer.parameters:
+            if tensor.grad_required:
+                clear_async(tensor.grad)
+        nntile_layer.backward_async()
+        results.append([to_numpy(nntile_layer.y.value),
+                to_numpy(nntile_layer.x.grad)] +
+                [to_numpy(p.grad) for p in nntile_layer.parameters
+                    if p.grad_required])
+        nntile_layer.unregister()
+        nntile_layer.x.unregister()
+        nntile_layer.y.unregister()
+
+    rtol = dtype2tol[dtype]['rtol']
+    for ref, val in zip(*results):
+        assert np.linalg.norm(ref - val) <= rtol * np.linalg.norm(ref)
+
+
 @pytest.mark.parametrize("bias", [False])
 @pytest.mark.parametrize(
     "params",
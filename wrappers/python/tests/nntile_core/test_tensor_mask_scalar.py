@@ -29,6 +29,10 @@ Tensor = {np.float32: nntile.tensor.Tensor_fp32,
 mask_scalar_func = {np.float32: nntile.nntile_core.tensor.mask_scalar_fp32,
                     np.float64: nntile.nntile_core.tensor.mask_scalar_fp64}
 
+# Causal mask and masked value, shared by all the test cases
+causal_mask = np.tril(np.ones((3, 3), dtype=bool))
+mask_value = -1000.
+
 
 @pytest.mark.parametrize('dtype', [np.float32, np.float64])
 def test_mask_scalar(dtype):
@@ -47,11 +51,9 @@ def test_mask_scalar(dtype):
     np_A = np.array(rand_A, dtype=dtype, order='F')
     A.from_array(np_A)
 
-    causal_mask = np.tril(np.ones((3, 3), dtype=bool))
-    mask_value = -1000.
     np_res = np.where(causal_mask[:, :, np.newaxis], np_A, mask_value)
 
-    mask.from_array(np.array(causal_mask, dtype=bool, order="F"))
+    mask.from_array(causal_mask)
     mask_scalar_func[dtype](mask, dtype(mask_value), A, 1)
     A.to_array(np_A)
     nntile.starpu.wait_for_all()
@@ -24,45 +24,56 @@ Tensor = {np.float32: nntile.tensor.Tensor_fp32,
           np.float64: nntile.tensor.Tensor_fp64}
 
 # Define mapping between tested function and numpy type
-sumnorm = {np.float32: nntile.nntile_core.tensor.sumnorm_fp32,
-           np.float64: nntile.nntile_core.tensor.sumnorm_fp64}
+sumnorm = {np.float32: nntile.nntile_core.tensor.sumnorm_async_fp32,
+           np.float64: nntile.nntile_core.tensor.sumnorm_async_fp64}
+sumnorm_blocking = {np.float32: nntile.nntile_core.tensor.sumnorm_fp32,
+                    np.float64: nntile.nntile_core.tensor.sumnorm_fp64}
 
 
 @pytest.mark.parametrize('dtype', [np.float32, np.float64])
 def test_sumnorm(dtype):
     # Describe single-tile tensor, located at node 0
     A_shape = [2, 3, 4]
-    B_shape = []
     ndim = len(A_shape)
-    for i in range(ndim):
-        B_shape.append([2] + A_shape[:i] + A_shape[i + 1:])
+    B_shape = [[2] + A_shape[:i] + A_shape[i + 1:] for i in range(ndim)]
     mpi_distr = [0]
     next_tag = 0
-    A_traits = nntile.tensor.TensorTraits(A_shape, A_shape)
-    B_traits = []
-    for i in range(ndim):
-        B_traits.append(nntile.tensor.TensorTraits(B_shape[i], B_shape[i]))
+    TensorTraits = nntile.tensor.TensorTraits
+    A_traits = TensorTraits(A_shape, A_shape)
+    B_traits = [TensorTraits(shape, shape) for shape in B_shape]
     # Tensor objects
-    A = Tensor[dtype](A_traits, mpi_distr, next_tag)
+    tensor_type = Tensor[dtype]
+    A = tensor_type(A_traits, mpi_distr, next_tag)
     next_tag = A.next_tag
     B = []
     for i in range(ndim):
-        B.append(Tensor[dtype](B_traits[i], mpi_distr, next_tag))
+        B.append(tensor_type(B_traits[i], mpi_distr, next_tag))
         next_tag = B[-1].next_tag
     # Set initial values of tensors
     rand_A = np.random.default_rng(42).standard_normal(A_shape)
     np_A = np.array(rand_A, dtype=dtype, order='F')
     A.from_array(np_A)
-    np_B = []
+    # Outputs need no initial values, as sumnorm clears them by itself
+    np_B = [np.empty(shape, dtype=dtype, order='F') for shape in B_shape]
+    # Submit reductions along all axes at once, as they are independent
+    sumnorm_func = sumnorm[dtype]
     for i in range(ndim):
-        np_B.append(np.zeros(B_shape[i], dtype=dtype, order='F'))
-        B[i].from_array(np_B[-1])
+        sumnorm_func(A, B[i], i)
+    nntile.starpu.wait_for_all()
     # Check result along each axis
+    np_A_sq = np_A * np_A
     for i in range(ndim):
-        sumnorm[dtype](A, B[i], i)
         B[i].to_array(np_B[i])
-        nntile.starpu.wait_for_all()
         B[i].unregister()
-        np_C = np.array([np.sum(np_A, axis=i), np.sum(np_A**2, axis=i)**0.5])
+        np_C = np.array([np.sum(np_A, axis=i),
+                         np.sqrt(np.sum(np_A_sq, axis=i))])
         assert np.allclose(np_B[i], np_C)
+    # Check blocking version along a single axis
+    B0 = tensor_type(B_traits[0], mpi_distr, next_tag)
+    next_tag = B0.next_tag
+    sumnorm_blocking[dtype](A, B0, 0)
+    B0.to_array(np_B[0])
+    B0.unregister()
+    np_C = np.array([np.sum(np_A, axis=0), np.sqrt(np.sum(np_A_sq, axis=0))])
+    assert np.allclose(np_B[0], np_C)
     A.unregister()